@@ -2,6 +2,7 @@
 import streamlit as st
 
 # Example data for a Swedish Resultatrapport (Income Statement) with monthly values and yearly sum
+import numpy as np
 import pandas as pd
 
 
@@ -47,20 +48,26 @@ subcat_values = [
 ]
 
 # Calculate total for 'Rörelsens kostnader' as sum of subcategories
-rk_total = [sum(x) for x in zip(*subcat_values)]
-monthly_values[1] = rk_total
+subcat_arr = np.array(subcat_values, dtype=np.int64)
+monthly_values[1] = subcat_arr.sum(axis=0)
 
 months = [
     "Jan", "Feb", "Mar", "Apr", "Maj", "Jun", "Jul", "Aug", "Sep", "Okt", "Nov", "Dec"
 ]
 
+# Subcategory rows, ready to insert below 'Rörelsens kostnader' when expanded
+SUBCAT_DF = pd.DataFrame(subcat_arr, columns=months, index=subcategories)
+SUBCAT_DF["Summa"] = SUBCAT_DF.sum(axis=1)
+SUBCAT_DF = SUBCAT_DF.reset_index().rename(columns={"index": "Konto"})
+SUBCAT_DF["Konto"] = "   └ " + SUBCAT_DF["Konto"]
+
 
 
 # Use st-aggrid for interactive table
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
 
 # Main DataFrame
-df = pd.DataFrame(monthly_values, columns=months, index=accounts)
+df = pd.DataFrame(np.vstack(monthly_values), columns=months, index=accounts)
 df["Summa"] = df.sum(axis=1)
 df.reset_index(inplace=True)
 df.rename(columns={"index": "Konto"}, inplace=True)
@@ -73,21 +80,12 @@ expand_subcats = st.checkbox("Visa underkategorier för Rörelsens kostnader", v
 
 
 # Build the display DataFrame
-display_rows = []
-for i, row in df.iterrows():
-    display_rows.append(row)
-    if row["Konto"] == "Rörelsens kostnader" and expand_subcats:
-        subcat_df = pd.DataFrame(subcat_values, columns=months, index=subcategories)
-        subcat_df["Summa"] = subcat_df.sum(axis=1)
-        subcat_df.reset_index(inplace=True)
-        subcat_df.rename(columns={"index": "Konto"}, inplace=True)
-        subcat_df["Konto"] = "   └ " + subcat_df["Konto"]
-        for _, subcat_row in subcat_df.iterrows():
-            display_rows.append(subcat_row)
-
-display_df = pd.DataFrame(display_rows, columns=df.columns)
+if expand_subcats:
+    i = accounts.index("Rörelsens kostnader")
+    display_df = pd.concat([df.iloc[:i + 1], SUBCAT_DF, df.iloc[i + 1:]], ignore_index=True)
+else:
+    display_df = df
 numeric_cols = display_df.select_dtypes(include='number').columns
-for col in numeric_cols:
-    display_df[col] = display_df[col].apply(lambda x: f"{x:,.0f}" if pd.notnull(x) else "")
+styler = display_df.style.format({col: "{:,.0f}" for col in numeric_cols}, na_rep="")
 
-st.dataframe(display_df, height=500)
+st.dataframe(styler, height=500)
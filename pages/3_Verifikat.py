@@ -1,9 +1,18 @@
 # 3_Verifikat.py
-from typing import Tuple
+import os
+from datetime import date
+from typing import List, Optional, Tuple
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 import streamlit as st
 import pandas as pd
 
-from tools.sie4_parser import SIE4Parser
+from tools.sie4_cache import get_parser
+
+# SIE_ENGINE=arrow ger pyarrow-backade kolumner (kräver pandas >= 2.0)
+SIE_ENGINE = os.environ.get("SIE_ENGINE", "pandas").lower()
 
 st.set_page_config(page_title="SIE4 – Verifikat", layout="wide")
 st.title("SIE4 – Verifikatvy")
@@ -14,11 +23,14 @@ st.markdown(
 )
 
 @st.cache_data(show_spinner=True)
-def parse_sie_bytes(file_bytes: bytes) -> Tuple[object, pd.DataFrame, pd.DataFrame]:
+def parse_sie_bytes(
+    file_bytes: bytes,
+) -> Tuple[object, pd.DataFrame, pd.DataFrame, Optional[date], Optional[date], List[str]]:
     """
-    Cachead parsning. Tar bytes -> Company + två DataFrames (verifikat & transaktioner).
+    Cachead parsning. Tar bytes -> Company + två DataFrames (verifikat & transaktioner)
+    + filtrens standardvärden (första/sista datum och alla serier).
     """
-    parser = SIE4Parser(infer_account_hierarchy=True)
+    parser = get_parser()
     company = parser.parse_bytes(file_bytes, encoding_candidates=("cp865",))
 
     df_vouchers = company.to_pandas_vouchers()
@@ -36,6 +48,9 @@ def parse_sie_bytes(file_bytes: bytes) -> Tuple[object, pd.DataFrame, pd.DataFra
                 "n_transactions": "Antal transaktioner",
             }
         ).sort_values(["Datum", "Serie", "Nr"])
+        df_vouchers["Datum"] = pd.to_datetime(df_vouchers["Datum"])
+        # Dold hjälpkolumn för fritextsök
+        df_vouchers["_text_lower"] = df_vouchers["Text"].str.lower()
 
     if not df_tx.empty:
         df_tx = df_tx.rename(
@@ -52,8 +67,56 @@ def parse_sie_bytes(file_bytes: bytes) -> Tuple[object, pd.DataFrame, pd.DataFra
                 "month": "Månad",
             }
         ).sort_values(["Datum", "Serie", "Nr", "Rad"])
+        df_tx["Datum"] = pd.to_datetime(df_tx["Datum"])
+        df_tx["_vtext_lower"] = df_tx["Verifikattext"].str.lower()
+        df_tx["Verifikat-ID"] = (
+            df_tx["Serie"].astype(str) + "-" + df_tx["Nr"].astype(str) + " (" + df_tx["Datum"].dt.date.astype(str) + ")"
+        )
+
+    # Filtrens standardvärden beror bara på filen – räkna ut dem här
+    min_date = max_date = None
+    all_series: List[str] = []
+    if not df_vouchers.empty:
+        min_date = df_vouchers["Datum"].min().date()
+        max_date = df_vouchers["Datum"].max().date()
+        all_series = sorted(df_vouchers["Serie"].dropna().unique().tolist())
+
+    if SIE_ENGINE == "arrow":
+        # Arrow-buffrar i stället för Python-objekt: strängsök och datumjämförelser körs i Arrow compute
+        df_vouchers = df_vouchers.convert_dtypes(dtype_backend="pyarrow")
+        df_tx = df_tx.convert_dtypes(dtype_backend="pyarrow")
+
+    return company, df_vouchers, df_tx, min_date, max_date, all_series
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def voucher_id_options(_dft: pd.DataFrame, file_id: str, series: Tuple[str, ...], date_range, search_text: str) -> list:
+    """
+    Cachade val till verifikat-listan. `_dft` hashas inte – nyckeln är fil + aktiva filter.
+    """
+    unique_vouchers = _dft[["Serie", "Nr", "Datum", "Verifikat-ID"]].drop_duplicates().sort_values(["Datum", "Serie", "Nr"])
+    return unique_vouchers["Verifikat-ID"].tolist()
+
 
-    return company, df_vouchers, df_tx
+@st.cache_data(show_spinner=False, max_entries=8)
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    """
+    CSV (utf-8 med BOM) via pyarrows C++-skrivare. Cachas på ramens innehåll;
+    max_entries begränsar hur många filtervarianter som hålls i minnet.
+    Format: datum som ÅÅÅÅ-MM-DD, strängar och rubriker inom citattecken, flyttal i
+    kortaste form (-1000 i stället för -1000.0) och tomma fält för saknade värden.
+    """
+    if "Dimensioner" in df.columns:
+        # Tupler kan inte skrivas av Arrow – text på en kopia, tabellen i vyn behåller tuplerna
+        df = df.assign(Dimensioner=df["Dimensioner"].map(lambda d: None if d is None else str(d)))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, f in enumerate(table.schema):
+        if pa.types.is_timestamp(f.type):
+            # Datum/Registreringsdatum saknar klockslag – skriv som rena datum
+            table = table.set_column(i, f.name, pc.cast(table.column(i), pa.date32()))
+    buf = pa.BufferOutputStream()
+    pacsv.write_csv(table, buf)
+    return b"\xef\xbb\xbf" + buf.getvalue().to_pybytes()
 
 
 uploaded = st.file_uploader("Ladda upp SIE4-fil", type=["se","sie", "SIE", "txt"])
@@ -63,7 +126,7 @@ if not uploaded:
 
 try:
     file_bytes = uploaded.getvalue()  # stabilt för caching
-    company, df_vouchers, df_tx = parse_sie_bytes(file_bytes)
+    company, df_vouchers, df_tx, min_date, max_date, all_series = parse_sie_bytes(file_bytes)
     st.caption(f"Filkodning: {company.source_encoding or 'okänd'}")
 except Exception as e:
     st.error(f"Kunde inte läsa SIE-filen: {e}")
@@ -84,28 +147,30 @@ if df_vouchers.empty:
     st.warning("Inga verifikat hittades i filen.")
     st.stop()
 
-min_date = pd.to_datetime(df_vouchers["Datum"]).min().date()
-max_date = pd.to_datetime(df_vouchers["Datum"]).max().date()
-all_series = sorted([s for s in df_vouchers["Serie"].dropna().unique()])
-
 c1, c2, c3 = st.columns([1.2, 1.2, 2.2])
 date_range = c1.date_input("Datumintervall", (min_date, max_date))
 selected_series = c2.multiselect("Serier", all_series, default=all_series)
 search_text = c3.text_input("Fritext (matchar Text)", "")
 
-dfv = df_vouchers.copy()
+# Samla alla aktiva filter i en mask och skiva en gång
+dfv = df_vouchers
+mask = np.ones(len(dfv), dtype=bool)
 if isinstance(date_range, tuple) and len(date_range) == 2:
-    start, end = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
-    dfv = dfv[(pd.to_datetime(dfv["Datum"]) >= start) & (pd.to_datetime(dfv["Datum"]) <= end)]
+    start, end = pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1])
+    mask &= ((dfv["Datum"] >= start) & (dfv["Datum"] <= end)).to_numpy(dtype=bool)
 if selected_series:
-    dfv = dfv[dfv["Serie"].isin(selected_series)]
+    mask &= dfv["Serie"].isin(selected_series).to_numpy(dtype=bool)
 if search_text.strip():
-    dfv = dfv[dfv["Text"].str.contains(search_text, case=False, na=False)]
+    mask &= dfv["_text_lower"].str.contains(search_text.lower(), na=False, regex=False).to_numpy(dtype=bool)
+dfv = dfv.loc[mask]
+
+# Dölj hjälpkolumner (prefix "_") i tabell och export
+voucher_cols = [c for c in dfv.columns if not c.startswith("_")]
 
 st.subheader("Verifikat")
-st.dataframe(dfv, hide_index=True, width='stretch')
+st.dataframe(dfv[voucher_cols], hide_index=True, width='stretch')
 
-csv_v = dfv.to_csv(index=False).encode("utf-8-sig")
+csv_v = to_csv_bytes(dfv[voucher_cols])
 st.download_button(
     "Ladda ner verifikat (CSV)",
     data=csv_v,
@@ -121,23 +186,21 @@ st.subheader("Transaktioner (matchar filtren ovan)")
 if df_tx is None or df_tx.empty:
     st.info("Inga transaktioner att visa.")
 else:
-    dft = df_tx.copy()
+    dft = df_tx
+    mask = np.ones(len(dft), dtype=bool)
     if isinstance(date_range, tuple) and len(date_range) == 2:
-        start, end = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
-        dft = dft[(pd.to_datetime(dft["Datum"]) >= start) & (pd.to_datetime(dft["Datum"]) <= end)]
+        start, end = pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1])
+        mask &= ((dft["Datum"] >= start) & (dft["Datum"] <= end)).to_numpy(dtype=bool)
     if selected_series:
-        dft = dft[dft["Serie"].isin(selected_series)]
+        mask &= dft["Serie"].isin(selected_series).to_numpy(dtype=bool)
     if search_text.strip():
-        dft = dft[dft["Verifikattext"].str.contains(search_text, case=False, na=False)]
+        mask &= dft["_vtext_lower"].str.contains(search_text.lower(), na=False, regex=False).to_numpy(dtype=bool)
+    dft = dft.loc[mask]
 
     # Valbar begränsning till specifika verifikat
-    dft["Verifikat-ID"] = (
-        dft["Serie"].astype(str) + "-" + dft["Nr"].astype(str) + " (" + pd.to_datetime(dft["Datum"]).dt.date.astype(str) + ")"
-    )
-    unique_vouchers = dft[["Serie", "Nr", "Datum", "Verifikat-ID"]].drop_duplicates().sort_values(["Datum", "Serie", "Nr"])
     selected_ids = st.multiselect(
         "Välj specifika verifikat (tomt = alla som matchar filtren)",
-        unique_vouchers["Verifikat-ID"].tolist(),
+        voucher_id_options(dft, uploaded.file_id, tuple(selected_series), date_range, search_text),
     )
     if selected_ids:
         dft = dft[dft["Verifikat-ID"].isin(selected_ids)]
@@ -148,7 +211,8 @@ else:
         width='stretch',
     )
 
-    csv_t = dft.to_csv(index=False).encode("utf-8-sig")
+    tx_cols = [c for c in dft.columns if not c.startswith("_")]
+    csv_t = to_csv_bytes(dft[tx_cols])
     st.download_button(
         "Ladda ner transaktioner (CSV)",
         data=csv_t,
@@ -1,7 +1,8 @@
 # app.py
 import streamlit as st
 import pandas as pd
-from tools.sie4_parser import SIE4Parser
+from tools.sie4_cache import get_parser
+from tools.sie4_parser import Company
 
 st.set_page_config(page_title="SIE4 – Verifikat (enkel)", layout="wide")
 st.title("SIE4 – Verifikat (enkel vy)")
@@ -11,36 +12,49 @@ if not uploaded:
     st.info("Välj en SIE4-fil för att börja.")
     st.stop()
 
+@st.cache_data(show_spinner=True)
+def parse_sie_bytes(file_bytes: bytes) -> tuple[Company, pd.DataFrame, pd.DataFrame]:
+    """
+    Cachead parsning. Tar bytes -> Company + omdöpta/sorterade DataFrames (verifikat & transaktioner).
+    Transaktionerna indexeras på (Serie, Nr, Datum) för snabb uppslagning per verifikat.
+    """
+    parser = get_parser()
+    company = parser.parse_bytes(file_bytes, encoding_candidates=("utf-8", "cp865", "cp1252", "latin1"))
+
+    df_v = company.to_pandas_vouchers().rename(columns={
+        "series": "Serie",
+        "number": "Nr",
+        "date": "Datum",
+        "text": "Text",
+        "reg_date": "Registreringsdatum",
+        "n_transactions": "Antal transaktioner",
+    }).sort_values(["Datum", "Serie", "Nr"])
+
+    df_t = company.to_pandas_transactions().rename(columns={
+        "series": "Serie",
+        "number": "Nr",
+        "voucher_date": "Datum",
+        "voucher_text": "Verifikattext",
+        "tx_index": "Rad",
+        "account": "Konto",
+        "amount": "Belopp",
+        "dim": "Dimensioner",
+        "text": "Transaktionstext",
+        "month": "Månad",
+    }).sort_values(["Datum", "Serie", "Nr", "Rad"])
+    df_v["Datum"] = pd.to_datetime(df_v["Datum"])
+    df_t["Datum"] = pd.to_datetime(df_t["Datum"])
+    df_t = df_t.set_index(["Serie", "Nr", "Datum"], drop=False).sort_index()
+
+    return company, df_v, df_t
+
+
 # Läs bytes (viktigt för korrekt decoding) och parsa med cp865 prioriterad
 file_bytes = uploaded.getvalue()
-parser = SIE4Parser(infer_account_hierarchy=True)
-company = parser.parse_bytes(file_bytes, encoding_candidates=("utf-8", "cp865", "cp1252", "latin1"))
+company, df_v, df_t = parse_sie_bytes(file_bytes)
 
 st.caption(f"Filkodning: {company.source_encoding or 'okänd'}")
 
-# DataFrames
-df_v = company.to_pandas_vouchers().rename(columns={
-    "series": "Serie",
-    "number": "Nr",
-    "date": "Datum",
-    "text": "Text",
-    "reg_date": "Registreringsdatum",
-    "n_transactions": "Antal transaktioner",
-}).sort_values(["Datum", "Serie", "Nr"])
-
-df_t = company.to_pandas_transactions().rename(columns={
-    "series": "Serie",
-    "number": "Nr",
-    "voucher_date": "Datum",
-    "voucher_text": "Verifikattext",
-    "tx_index": "Rad",
-    "account": "Konto",
-    "amount": "Belopp",
-    "dim": "Dimensioner",
-    "text": "Transaktionstext",
-    "month": "Månad",
-}).sort_values(["Datum", "Serie", "Nr", "Rad"])
-
 if df_v.empty:
     st.warning("Inga verifikat hittades i filen.")
     st.stop()
@@ -71,15 +85,15 @@ if not selected_rows:
 row = selected_rows[0]
 selected = edited.loc[row]
 
-# Filtrera transaktioner för valt verifikat
-mask = (
-    (df_t["Serie"] == selected["Serie"]) &
-    (df_t["Nr"] == selected["Nr"]) &
-    (pd.to_datetime(df_t["Datum"]).dt.date == pd.to_datetime(selected["Datum"]).date())
-)
-tx_for_voucher = df_t.loc[mask, ["Datum", "Serie", "Nr", "Rad", "Konto", "Belopp", "Transaktionstext", "Dimensioner"]]
+# Slå upp transaktioner för valt verifikat i indexet (Serie, Nr, Datum)
+tx_columns = ["Datum", "Serie", "Nr", "Rad", "Konto", "Belopp", "Transaktionstext", "Dimensioner"]
+try:
+    voucher_id = (selected["Serie"], selected["Nr"], pd.Timestamp(selected["Datum"]).normalize())
+    tx_for_voucher = df_t.loc[[voucher_id], tx_columns]
+except KeyError:
+    tx_for_voucher = df_t.iloc[:0][tx_columns]
 
-st.subheader(f"Transaktioner för {selected['Serie']}-{selected['Nr']} ({pd.to_datetime(selected['Datum']).date()})")
+st.subheader(f"Transaktioner för {selected['Serie']}-{selected['Nr']} ({pd.Timestamp(selected['Datum']).date()})")
 if tx_for_voucher.empty:
     st.info("Inga transaktioner hittades för det valda verifikatet.")
 else:
@@ -1,7 +1,9 @@
 # app.py
+import numpy as np
 import pandas as pd
 import streamlit as st
-from tools.sie4_parser import SIE4Parser
+from tools.sie4_cache import get_parser
+from tools.sie4_parser import Company
 
 st.set_page_config(page_title="SIE4 – Verifikat (1 tabell, expandera rad)", layout="wide")
 st.title("SIE4 – Verifikat (1 tabell)")
@@ -12,85 +14,129 @@ if not uploaded:
     st.stop()
 
 # --- Parse SIE ---
-file_bytes = uploaded.getvalue()
-parser = SIE4Parser(infer_account_hierarchy=True)
-company = parser.parse_bytes(file_bytes, encoding_candidates=("utf-8","cp865","cp1252","latin1"))
-st.caption(f"Filkodning: {company.source_encoding or 'okänd'}")
+@st.cache_data(show_spinner=True)
+def parse_sie_bytes(file_bytes: bytes) -> tuple[Company, pd.DataFrame, pd.DataFrame]:
+    """
+    Cachead parsning. Tar bytes -> Company + omdöpta/sorterade DataFrames (verifikat & transaktioner).
+    """
+    parser = get_parser()
+    company = parser.parse_bytes(file_bytes, encoding_candidates=("utf-8","cp865","cp1252","latin1"))
+
+    df_v = company.to_pandas_vouchers().rename(columns={
+        "series":"Serie","number":"Nr","date":"Datum","text":"Text",
+        "reg_date":"Registreringsdatum","n_transactions":"Antal transaktioner"
+    }).sort_values(["Datum","Serie","Nr"]).reset_index(drop=True)
+
+    df_t = company.to_pandas_transactions().rename(columns={
+        "series":"Serie","number":"Nr","voucher_date":"Datum","voucher_text":"Verifikattext",
+        "tx_index":"Rad","account":"Konto","amount":"Belopp","dim":"Dimensioner","text":"Transaktionstext",
+    }).sort_values(["Datum","Serie","Nr","Rad"]).reset_index(drop=True)
+    df_v["Datum"] = pd.to_datetime(df_v["Datum"])
+    df_t["Datum"] = pd.to_datetime(df_t["Datum"])
 
-df_v = company.to_pandas_vouchers().rename(columns={
-    "series":"Serie","number":"Nr","date":"Datum","text":"Text",
-    "reg_date":"Registreringsdatum","n_transactions":"Antal transaktioner"
-}).sort_values(["Datum","Serie","Nr"]).reset_index(drop=True)
+    return company, df_v, df_t
 
-df_t = company.to_pandas_transactions().rename(columns={
-    "series":"Serie","number":"Nr","voucher_date":"Datum","voucher_text":"Verifikattext",
-    "tx_index":"Rad","account":"Konto","amount":"Belopp","dim":"Dimensioner","text":"Transaktionstext",
-}).sort_values(["Datum","Serie","Nr","Rad"]).reset_index(drop=True)
+
+file_bytes = uploaded.getvalue()
+company, df_v, df_t = parse_sie_bytes(file_bytes)
+st.caption(f"Filkodning: {company.source_encoding or 'okänd'}")
 
 if df_v.empty:
     st.warning("Inga verifikat hittades i filen.")
     st.stop()
 
 # Unik nyckel per verifikat (för att injicera transaktionerna på rätt ställe)
-def voucher_key(serie, nr, datum) -> str:
-    return f"{serie}|{nr}|{pd.to_datetime(datum).date()}"
-
-df_v = df_v.assign(Key=[voucher_key(r.Serie, r.Nr, r.Datum) for _, r in df_v.iterrows()])
+dates = df_v["Datum"].dt.date.astype(str)
+df_v["Key"] = df_v["Serie"].astype(str) + "|" + df_v["Nr"].astype(str) + "|" + dates
 
 # Håll reda på vilken rad som är expanderad
 if "expanded_key" not in st.session_state:
     st.session_state.expanded_key = None
 
-def build_display_df(expanded_key: str | None) -> pd.DataFrame:
-    rows = []
-    for _, v in df_v.iterrows():
-        # Verifikatrad
-        rows.append({
-            "Expandera": bool(expanded_key == v.Key),
-            "Typ": "Verifikat",
-            "Datum": pd.to_datetime(v["Datum"]).date(),
-            "Serie": v["Serie"],
-            "Nr": v["Nr"],
-            "Text": v.get("Text",""),
-            "Konto": None, "Rad": None, "Belopp": None,
-            "Transaktionstext": None, "Dimensioner": None,
-            "Antal transaktioner": int(v.get("Antal transaktioner", 0)),
-            "Key": v.Key,          # dold kolumn
-            "_is_child": False,    # dold, för eget bruk
+# Förberedda delar av tabellen – byggs en gång per uppladdad fil och sparas i session_state
+def prepare_display_parts(df_v: pd.DataFrame, df_t: pd.DataFrame) -> dict:
+    # Verifikatrader med tabellens slutliga kolumner. Tomma celler är typade
+    # (NaN för Belopp, <NA> för heltalen) så att parent och child har samma dtypes.
+    n_v = len(df_v)
+    parents = pd.DataFrame({
+        "Expandera": False,
+        "Typ": "Verifikat",
+        "Datum": df_v["Datum"],
+        "Serie": df_v["Serie"],
+        "Nr": df_v["Nr"],
+        "Text": df_v["Text"],
+        "Konto": None,
+        "Rad": pd.array([pd.NA] * n_v, dtype="Int64"),
+        "Belopp": np.full(n_v, np.nan),
+        "Transaktionstext": None, "Dimensioner": None,
+        "Antal transaktioner": df_v["Antal transaktioner"].astype("Int64"),
+        "Key": df_v["Key"],    # dold kolumn
+        "_is_child": False,    # dold, för eget bruk
+    })
+
+    # Transaktionsrader (child) med samma kolumner, grupperade per verifikatnyckel
+    if df_t.empty:
+        children, tx_positions = parents.iloc[:0], {}
+    else:
+        tx_dates = df_t["Datum"].dt.date
+        children = pd.DataFrame({
+            "Expandera": False,      # ignoreras för child-rader
+            "Typ": "   └─ Transaktion",
+            "Datum": df_t["Datum"],
+            "Serie": df_t["Serie"],
+            "Nr": df_t["Nr"],
+            "Text": "",
+            "Konto": df_t["Konto"],
+            "Rad": df_t["Rad"].astype("Int64"),
+            "Belopp": df_t["Belopp"].astype(float),
+            "Transaktionstext": df_t["Transaktionstext"],
+            "Dimensioner": df_t["Dimensioner"].map(lambda d: None if d is None else str(d)),
+            "Antal transaktioner": pd.array([pd.NA] * len(df_t), dtype="Int64"),
+            "Key": None,            # child har ingen key
+            "_is_child": True,
         })
+        tx_keys = df_t["Serie"].astype(str) + "|" + df_t["Nr"].astype(str) + "|" + tx_dates.astype(str)
+        tx_positions = children.groupby(tx_keys, sort=False).indices
+
+    return {
+        "parents": parents,
+        "parent_pos": dict(zip(parents["Key"], range(len(parents)))),
+        "children": children,
+        "tx_positions": tx_positions,
+    }
 
-        # Om denna är expanderad: injicera transaktionerna som rader direkt under
-        if expanded_key == v.Key and not df_t.empty:
-            mask = (
-                (df_t["Serie"] == v["Serie"]) &
-                (df_t["Nr"] == v["Nr"]) &
-                (pd.to_datetime(df_t["Datum"]).dt.date == pd.to_datetime(v["Datum"]).date())
-            )
-            tx = df_t.loc[mask, ["Datum","Serie","Nr","Rad","Konto","Belopp","Transaktionstext","Dimensioner"]]
-            for _, t in tx.iterrows():
-                rows.append({
-                    "Expandera": False,      # ignoreras för child-rader
-                    "Typ": "   └─ Transaktion",
-                    "Datum": pd.to_datetime(t["Datum"]).date() if pd.notna(t["Datum"]) else None,
-                    "Serie": t["Serie"],
-                    "Nr": t["Nr"],
-                    "Text": "",
-                    "Konto": t.get("Konto"),
-                    "Rad": int(t["Rad"]) if pd.notna(t["Rad"]) else None,
-                    "Belopp": float(t["Belopp"]) if pd.notna(t["Belopp"]) else None,
-                    "Transaktionstext": t.get("Transaktionstext"),
-                    "Dimensioner": None if t.get("Dimensioner") is None else str(t.get("Dimensioner")),
-                    "Antal transaktioner": None,
-                    "Key": None,            # child har ingen key
-                    "_is_child": True,
-                })
-    return pd.DataFrame(rows)
-
-# 1) Bygg tabellen utifrån nuvarande expanded_key
-df_display = build_display_df(st.session_state.expanded_key)
+if st.session_state.get("display_parts_file") != uploaded.file_id:
+    st.session_state.display_parts = prepare_display_parts(df_v, df_t)
+    st.session_state.display_parts_file = uploaded.file_id
+
+def build_display_df(expanded_key: str | None) -> pd.DataFrame:
+    parts = st.session_state.display_parts
+    parents = parts["parents"]
+    pos = parts["parent_pos"].get(expanded_key)
+    if pos is None:
+        return parents
+
+    # Injicera transaktionerna som rader direkt under det expanderade verifikatet.
+    # Delarna har identiska dtypes, så concat behåller dem (ingen radvis inferens).
+    tx_rows = parts["tx_positions"].get(expanded_key, np.empty(0, dtype=np.intp))
+    df = pd.concat(
+        [parents.iloc[:pos + 1], parts["children"].iloc[tx_rows], parents.iloc[pos + 1:]],
+        ignore_index=True,
+    )
+    df.iat[pos, df.columns.get_loc("Expandera")] = True
+    return df
+
+# 1) Bygg tabellen utifrån nuvarande expanded_key (återanvänd senaste om fil och val är oförändrade)
+display_cache_key = (st.session_state.expanded_key, uploaded.file_id)
+cached = st.session_state.get("display_df_cache")
+if cached is not None and cached[0] == display_cache_key:
+    df_display = cached[1]
+else:
+    df_display = build_display_df(st.session_state.expanded_key)
+    st.session_state.display_df_cache = (display_cache_key, df_display)
 
 # 2) Visa ENDA tabellen (data_editor) — använd checkbox-kolumnen för att "klicka"
-edited = st.data_editor(
+st.data_editor(
     df_display,
     hide_index=True,
     use_container_width=True,
@@ -108,14 +154,17 @@ edited = st.data_editor(
     key="verifikat_single_table",
 )
 
-# 3) Tolkning av klick: hitta första parent-rad med Expandera=True
-#    (Ignorera child-rader eftersom deras Key är None)
-try:
-    expanded_keys = edited.loc[(edited["Expandera"] == True) & (edited["Key"].notna()), "Key"].tolist()
-except Exception:
-    expanded_keys = []
-
-new_key = expanded_keys[0] if expanded_keys else None
+# 3) Tolkning av klick: läs bara ändrade rader (edited_rows) i stället för att skanna hela tabellen.
+#    Första parent-rad med Expandera=True vinner; child-rader ignoreras eftersom deras Key är None.
+changes = st.session_state.get("verifikat_single_table", {}).get("edited_rows", {})
+checked_rows = {int(r) for r, patch in changes.items() if patch.get("Expandera") is True}
+current_pos = st.session_state.display_parts["parent_pos"].get(st.session_state.expanded_key)
+if current_pos is not None and changes.get(current_pos, {}).get("Expandera") is not False:
+    checked_rows.add(current_pos)  # redan expanderad och inte avbockad
+
+key_col = df_display.columns.get_loc("Key")
+expanded_keys = [df_display.iat[r, key_col] for r in sorted(checked_rows) if r < len(df_display)]
+new_key = next((k for k in expanded_keys if k is not None), None)
 
 # Om valet ändrats: uppdatera session_state och rerun så tabellen injiceras rätt
 if new_key != st.session_state.expanded_key:
@@ -0,0 +1,149 @@
+# tools/_trans_scan.py
+"""
+Valfri Numba-kompilerad skanner för enkla #TRANS-rader.
+
+Skannern går igenom hela filens bytes en gång, delar upp raderna (\r\n, \r, \n)
+och tolkar rader på formen '#TRANS <konto> [{}] <belopp> ["text"]' direkt till
+offset- och beloppsarrayer. Övriga rader tolkas av den vanliga Python-parsern.
+Utan numba är scan_trans_lines None och parsern använder enbart Python-vägen.
+"""
+try:
+    import numpy as np
+    from numba import njit
+except ImportError:
+    np = njit = None
+
+_SP, _QUOTE, _LBRACE, _RBRACE = 32, 34, 123, 125
+_CR, _LF, _TAB = 13, 10, 9
+_MAX_DIGITS = 15  # mantissan ryms exakt i en double -> samma resultat som float()
+
+if njit is not None:
+    _POW10 = np.array([10.0 ** k for k in range(_MAX_DIGITS + 1)])
+
+    @njit(cache=True)
+    def _scan_line(buf, s, e):
+        # Returnerar (konto_start, konto_slut, belopp, text_start, text_slut);
+        # konto_start == -1 betyder att raden inte är en enkel #TRANS-rad.
+        no = (-1, -1, 0.0, -1, -1)
+        if e - s < 8:
+            return no
+        # '#TRANS ' i versaler i början av raden
+        if (buf[s] != 35 or buf[s + 1] != 84 or buf[s + 2] != 82 or buf[s + 3] != 65
+                or buf[s + 4] != 78 or buf[s + 5] != 83 or buf[s + 6] != _SP):
+            return no
+        for k in range(s, e):
+            if buf[k] == _TAB:
+                return no
+        j = s + 7
+        while j < e and buf[j] == _SP:
+            j += 1
+        # Konto: bara siffror
+        a0 = j
+        while j < e and 48 <= buf[j] <= 57:
+            j += 1
+        a1 = j
+        if a1 == a0 or j >= e or buf[j] != _SP:
+            return no
+        while j < e and buf[j] == _SP:
+            j += 1
+        # Valfri tom objektlista '{}'
+        if j + 2 < e and buf[j] == _LBRACE and buf[j + 1] == _RBRACE and buf[j + 2] == _SP:
+            j += 2
+            while j < e and buf[j] == _SP:
+                j += 1
+        # Belopp: [+-]?[0-9]+([.,][0-9]+)?
+        neg = False
+        if j < e and (buf[j] == 43 or buf[j] == 45):
+            neg = buf[j] == 45
+            j += 1
+        mant = 0
+        digits = 0
+        frac = 0
+        d0 = j
+        while j < e and 48 <= buf[j] <= 57:
+            mant = mant * 10 + (buf[j] - 48)
+            digits += 1
+            j += 1
+        if j == d0:
+            return no
+        if j < e and (buf[j] == 46 or buf[j] == 44):
+            j += 1
+            f0 = j
+            while j < e and 48 <= buf[j] <= 57:
+                mant = mant * 10 + (buf[j] - 48)
+                digits += 1
+                j += 1
+            frac = j - f0
+            if frac == 0:
+                return no
+        if digits > _MAX_DIGITS:
+            return no
+        amount = mant / _POW10[frac]
+        if neg:
+            amount = -amount
+        amount_end = j
+        while j < e and buf[j] == _SP:
+            j += 1
+        if j == e:
+            return (a0, a1, amount, -1, -1)
+        # Valfri citerad text sist på raden, föregången av mellanslag
+        if buf[j] != _QUOTE or j == amount_end:
+            return no
+        t0 = j + 1
+        k = t0
+        while k < e and buf[k] != _QUOTE:
+            k += 1
+        if k >= e:
+            return no
+        t1 = k
+        k += 1
+        while k < e and buf[k] == _SP:
+            k += 1
+        if k != e:
+            return no
+        return (a0, a1, amount, t0, t1)
+
+    @njit(cache=True)
+    def scan_trans_lines(buf):
+        """
+        buf: uint8-array med filens bytes (enbytes-encoding).
+        Returnerar (radstart, radslut, konto_start, konto_slut, belopp, text_start, text_slut)
+        per rad; konto_start -1 för rader som Python-parsern ska ta hand om.
+        """
+        n = buf.shape[0]
+        max_lines = 1
+        for i in range(n):
+            if buf[i] == _LF or buf[i] == _CR:
+                max_lines += 1
+        starts = np.empty(max_lines, np.int64)
+        ends = np.empty(max_lines, np.int64)
+        acc_s = np.empty(max_lines, np.int64)
+        acc_e = np.empty(max_lines, np.int64)
+        amounts = np.empty(max_lines, np.float64)
+        txt_s = np.empty(max_lines, np.int64)
+        txt_e = np.empty(max_lines, np.int64)
+        nl = 0
+        i = 0
+        while True:
+            s = i
+            while i < n and buf[i] != _LF and buf[i] != _CR:
+                i += 1
+            a0, a1, amount, t0, t1 = _scan_line(buf, s, i)
+            starts[nl] = s
+            ends[nl] = i
+            acc_s[nl] = a0
+            acc_e[nl] = a1
+            amounts[nl] = amount
+            txt_s[nl] = t0
+            txt_e[nl] = t1
+            nl += 1
+            if i >= n:
+                break
+            if buf[i] == _CR and i + 1 < n and buf[i + 1] == _LF:
+                i += 2
+            else:
+                i += 1
+        return (starts[:nl], ends[:nl], acc_s[:nl], acc_e[:nl],
+                amounts[:nl], txt_s[:nl], txt_e[:nl])
+else:
+    scan_trans_lines = None
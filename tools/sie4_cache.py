@@ -0,0 +1,10 @@
+# tools/sie4_cache.py
+import streamlit as st
+
+from tools.sie4_parser import SIE4Parser
+
+
+@st.cache_resource
+def get_parser() -> SIE4Parser:
+    # Parsern är tillståndslös mellan anrop och kan delas av alla sidor och sessioner
+    return SIE4Parser(infer_account_hierarchy=True)
@@ -1,22 +1,76 @@
 # tools/sie4_parser.py
 from __future__ import annotations
-from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Tuple, Iterable, Union, IO
+from array import array
+import codecs
+import io
+import re
+from dataclasses import dataclass, field, fields
+from typing import Callable, Dict, List, Optional, Tuple, Iterable, Iterator, Union, IO
 from datetime import date, datetime
 from pathlib import Path
-import re
 
 try:
+    import numpy as np
     import pandas as pd  # valfritt; krävs bara för DataFrame-hjälpare
 except ImportError:
-    pd = None
+    np = pd = None
+
+try:
+    from tools._trans_scan import scan_trans_lines  # kräver numba
+except ImportError:
+    scan_trans_lines = None
+
+# Konstanter för den heta parsningsloopen
+# Tar bort alla ASCII-tecken utom siffror (C-nivå, ingen regexmotor)
+_DIGIT_ONLY = str.maketrans('', '', ''.join(c for c in map(chr, range(128)) if not c.isdigit()))
+_QUOTES = ('"', "'")
+# Reserv för kommandon som inte följs av ett mellanslag (se _split_command)
+_CMD_RE = re.compile(r"#[A-Z0-9]+", re.IGNORECASE)
+_PROBE_BYTES = 64 * 1024  # stickprov för encoding-gissning
+# Under denna storlek kostar Numba-anropet mer än det sparar
+_JIT_MIN_BYTES = 512 * 1024
+
+
+def _parse_amount(s: str) -> float:
+    # Decimalkomma stöds, men ny sträng allokeras bara när det faktiskt finns ett komma
+    return float(s) if "," not in s else float(s.replace(",", "."))
+
+
+def _to_number(t: str) -> Optional[float]:
+    """Tal som '-1000,00'/'1000.00', annars None. Teckentest först, sedan float() i C."""
+    if not t:
+        return None
+    # Samma språk som [+-]?[0-9]+([.,][0-9]+)? men utan regexmotor. SIE4-belopp är
+    # ASCII: explicita teckenintervall i stället för Unicode-medvetna isdecimal().
+    c = t[0]
+    if c in "+-":
+        if len(t) < 2 or not "0" <= t[1] <= "9":
+            return None  # '-.5', '+inf'
+    elif not "0" <= c <= "9":
+        return None  # klamrar, citat, text
+    if not "0" <= t[-1] <= "9" or "_" in t or "e" in t or "E" in t:
+        return None  # '1.', '1_000', '1e5' som float() annars skulle godta
+    try:
+        return _parse_amount(t)
+    except ValueError:
+        return None
+
+
+def _parse_yyyymmdd(s: str) -> date:
+    # Memoiseras per parsning i _ParseState.parse_date
+    if len(s) == 8 and s.isdigit() and s.isascii():
+        return date(int(s[0:4]), int(s[4:6]), int(s[6:8]))
+    digits = s.translate(_DIGIT_ONLY)
+    if not digits.isascii():
+        digits = ''.join(c for c in digits if '0' <= c <= '9')
+    return datetime.strptime(digits, "%Y%m%d").date()
 
 
 # ---------------------------
 # Domänmodell
 # ---------------------------
 
-@dataclass
+@dataclass(slots=True)
 class Account:
     number: str
     name: str = ""
@@ -34,7 +88,7 @@ class Account:
         return list(reversed(chain))
 
 
-@dataclass
+@dataclass(slots=True)
 class Transaction:
     account: str
     amount: float
@@ -42,24 +96,45 @@ class Transaction:
     text: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Voucher:
     series: str
     number: str
     date: date
     text: str = ""
     reg_date: Optional[date] = None
-    transactions: List[Transaction] = field(default_factory=list)
-
-
-@dataclass
+    # Transaktionerna lagras kolumnvis (parallella listor, belopp som packade doubles)
+    accounts: List[str] = field(default_factory=list)
+    amounts: array = field(default_factory=lambda: array("d"))
+    dims: List[Optional[Tuple[str, ...]]] = field(default_factory=list)
+    texts: List[Optional[str]] = field(default_factory=list)
+
+    def add_transaction(self, account: str, amount: float,
+                        dim: Optional[Tuple[str, ...]] = None, text: Optional[str] = None) -> None:
+        self.accounts.append(account)
+        self.amounts.append(amount)
+        self.dims.append(dim)
+        self.texts.append(text)
+
+    def iter_transactions(self) -> Iterator[Tuple[str, float, Optional[Tuple[str, ...]], Optional[str]]]:
+        """(account, amount, dim, text) per transaktion, utan att skapa Transaction-objekt."""
+        return zip(self.accounts, self.amounts, self.dims, self.texts)
+
+    @property
+    def transactions(self) -> Tuple[Transaction, ...]:
+        # Skrivskyddad vy som byggs vid varje anrop; tupel så att t.ex. .append() ger
+        # AttributeError i stället för att tyst försvinna – lägg till via add_transaction()
+        return tuple([Transaction(account=a, amount=m, dim=d, text=t) for a, m, d, t in self.iter_transactions()])
+
+
+@dataclass(slots=True)
 class RAR:  # Räkenskapsår
     idx: int
     start: date
     end: date
 
 
-@dataclass
+@dataclass(slots=True)
 class Company:
     orgnr: Optional[str] = None
     name: Optional[str] = None
@@ -71,75 +146,151 @@ class Company:
     accounts: Dict[str, Account] = field(default_factory=dict)
     vouchers: List[Voucher] = field(default_factory=list)
     source_encoding: Optional[str] = None  # <-- ny: vilken encoding som lyckades
+    # Memoiserade to_pandas_*-resultat; töms med invalidate_cache() efter ändringar i modellen
+    _df_cache: Dict[str, "pd.DataFrame"] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def __getstate__(self):
+        # Cachen följer inte med vid pickling (t.ex. st.cache_data) – den byggs om vid behov.
+        # Med __slots__ finns ingen __dict__, så tillståndet byggs från fälten.
+        state = {f.name: getattr(self, f.name) for f in fields(self)}
+        state["_df_cache"] = {}
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def invalidate_cache(self) -> None:
+        """Töm cachade DataFrames; anropa efter att accounts/vouchers har ändrats."""
+        self._df_cache.clear()
 
     # --- Pandas helpers ---
+    # Returnerade DataFrames delas mellan anrop – kopiera innan de muteras.
     def to_pandas_accounts(self):
         if pd is None:
             raise ImportError("pandas is not installed")
-        rows = []
-        for acc in self.accounts.values():
-            parent = acc.parent.number if acc.parent else None
-            rows.append({
-                "account": acc.number,
-                "name": acc.name,
-                "parent": parent,
-                "sru": acc.sru,
-                "opening_balance": acc.opening_balance,
-                "closing_balance": acc.closing_balance,
-            })
-        return pd.DataFrame(rows).sort_values("account")
+        cached = self._df_cache.get("accounts")
+        if cached is not None:
+            return cached
+        # Kolumnvis i redan sorterad kontoordning (ingen sort_values i efterhand)
+        accs = [self.accounts[k] for k in sorted(self.accounts)]
+        df = pd.DataFrame({
+            "account": [acc.number for acc in accs],
+            "name": [acc.name for acc in accs],
+            "parent": [acc.parent.number if acc.parent else None for acc in accs],
+            "sru": [acc.sru for acc in accs],
+            "opening_balance": [acc.opening_balance for acc in accs],
+            "closing_balance": [acc.closing_balance for acc in accs],
+        })
+        self._df_cache["accounts"] = df
+        return df
 
     def to_pandas_vouchers(self):
         if pd is None:
             raise ImportError("pandas is not installed")
-        rows = []
-        for v in self.vouchers:
-            rows.append({
-                "series": v.series,
-                "number": v.number,
-                "date": pd.to_datetime(v.date),
-                "text": v.text,
-                "reg_date": pd.to_datetime(v.reg_date) if v.reg_date else None,
-                "n_transactions": len(v.transactions),
-            })
-        return pd.DataFrame(rows).sort_values(["date", "series", "number"])
+        cached = self._df_cache.get("vouchers")
+        if cached is not None:
+            return cached
+        vouchers = self.vouchers
+        # Datum konverteras vektoriserat (ett anrop) i stället för pd.to_datetime per verifikat
+        df = pd.DataFrame({
+            "series": [v.series for v in vouchers],
+            "number": [v.number for v in vouchers],
+            "date": pd.to_datetime([v.date for v in vouchers]),
+            "text": [v.text for v in vouchers],
+            "reg_date": pd.to_datetime([v.reg_date for v in vouchers]),
+            "n_transactions": [len(v.accounts) for v in vouchers],
+        }).sort_values(["date", "series", "number"])
+        self._df_cache["vouchers"] = df
+        return df
 
     def to_pandas_transactions(self):
         if pd is None:
             raise ImportError("pandas is not installed")
-        rows = []
-        for v in self.vouchers:
-            for i, t in enumerate(v.transactions, start=1):
-                rows.append({
-                    "series": v.series,
-                    "number": v.number,
-                    "voucher_date": pd.to_datetime(v.date),
-                    "voucher_text": v.text,
-                    "tx_index": i,
-                    "account": t.account,
-                    "amount": t.amount,
-                    "dim": t.dim,
-                    "text": t.text,
-                })
-        df = pd.DataFrame(rows)
+        cached = self._df_cache.get("tx")
+        if cached is not None:
+            return cached
+        vouchers = self.vouchers
+        # Verifikatnivåns kolumner byggs en gång per verifikat och upprepas med np.repeat
+        counts = np.fromiter((len(v.accounts) for v in vouchers), dtype=np.int64, count=len(vouchers))
+        total = int(counts.sum())
+
+        def per_voucher(values):
+            return np.repeat(np.array(values, dtype=object), counts)
+
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        vdates = pd.to_datetime([v.date for v in vouchers]).values
+        accounts, dims, texts = [], [], []
+        amounts = array("d")
+        for v in vouchers:
+            accounts.extend(v.accounts)
+            amounts.extend(v.amounts)  # memcpy av packade doubles
+            dims.extend(v.dims)
+            texts.extend(v.texts)
+        df = pd.DataFrame({
+            "series": per_voucher([v.series for v in vouchers]),
+            "number": per_voucher([v.number for v in vouchers]),
+            "voucher_date": np.repeat(vdates, counts),
+            "voucher_text": per_voucher([v.text for v in vouchers]),
+            "tx_index": np.arange(1, total + 1) - starts,
+            "account": accounts,
+            "amount": np.frombuffer(amounts, dtype=np.float64) if amounts else np.empty(0),
+            "dim": dims,
+            "text": texts,
+        })
         if not df.empty:
-            df["month"] = df["voucher_date"].dt.to_period("M").astype(str)
+            # 'YYYY-MM' formateras en gång per verifikat via datetime64[M], inte per rad
+            df["month"] = np.repeat(vdates.astype("datetime64[M]").astype(str), counts)
+        self._df_cache["tx"] = df
         return df
 
     def to_pandas_monthly_by_account(self):
         if pd is None:
             raise ImportError("pandas is not installed")
+        cached = self._df_cache.get("monthly")
+        if cached is not None:
+            return cached
         tx = self.to_pandas_transactions()
         if tx.empty:
             return tx
-        pivot = (tx
-                 .groupby(["account", "month"], as_index=False)["amount"]
-                 .sum()
-                 .pivot(index="account", columns="month", values="amount")
-                 .fillna(0.0)
-                 .sort_index())
+        pivot = tx.pivot_table(index="account", columns="month", values="amount",
+                               aggfunc="sum", fill_value=0.0)
         acc = self.to_pandas_accounts().set_index("account")[["name"]]
-        return acc.join(pivot, how="left").fillna(0.0)
+        # Konton utan transaktioner får 0.0 direkt vid reindex (ingen NaN + fillna-pass)
+        df = acc.join(pivot.reindex(acc.index, fill_value=0.0))
+        self._df_cache["monthly"] = df
+        return df
+
+
+@dataclass
+class _ParseState:
+    """Föränderligt tillstånd under en parsning (delas av kommandohanterarna)."""
+    company: Company
+    voucher: Optional[Voucher] = None  # öppet #VER-block
+    # Delade strängobjekt för återkommande kontonummer/dimensioner
+    strings: Dict[str, str] = field(default_factory=dict)
+    dim_tuples: Dict[Tuple[str, ...], Tuple[str, ...]] = field(default_factory=dict)
+    # Rå datumtoken -> date; en fil har sällan mer än några hundra olika datum
+    dates: Dict[str, date] = field(default_factory=dict)
+
+    def intern_account(self, acc_no: str) -> str:
+        # Återanvänd nyckeln i company.accounts om kontot finns, annars en egen tabell
+        acc = self.company.accounts.get(acc_no)
+        if acc is not None:
+            return acc.number
+        return self.strings.setdefault(acc_no, acc_no)
+
+    def intern_dims(self, found: List[str]) -> Tuple[str, ...]:
+        # Delade strängar per dimension och identiska tupler delas mellan rader
+        strings = self.strings
+        dims = tuple([strings.setdefault(d, d) for d in found])
+        return self.dim_tuples.setdefault(dims, dims)
+
+    def parse_date(self, s: str) -> date:
+        d = self.dates.get(s)
+        if d is None:
+            d = self.dates[s] = _parse_yyyymmdd(s)
+        return d
 
 
 # ---------------------------
@@ -154,13 +305,27 @@ class SIE4Parser:
     Tålig mot extra tokens/klamrar och olika decimaltecken.
     """
 
-    _num_re = re.compile(r'^[+-]?\d+(?:[.,]\d+)?$')
-
     # Standardordning på encodings vi testar:
     DEFAULT_ENCODINGS: Tuple[str, ...] = ("utf-8", "cp865", "cp1252", "latin1")
 
     def __init__(self, infer_account_hierarchy: bool = True):
         self.infer_account_hierarchy = infer_account_hierarchy
+        # Dispatch-tabell: en dict-uppslagning per rad i stället för en lång if/elif-kedja
+        self._handlers: Dict[str, Callable[[List[str], _ParseState], None]] = {
+            "#TRANS": self._h_trans,
+            "#VER": self._h_ver,
+            "#KONTO": self._h_konto,
+            "#SRU": self._h_sru,
+            "#IB": self._h_ib,
+            "#UB": self._h_ub,
+            "#RAR": self._h_rar,
+            "#PROGRAM": self._h_program,
+            "#FORMAT": self._h_format,
+            "#GEN": self._h_gen,
+            "#SIETYP": self._h_sietyp,
+            "#ORGNR": self._h_orgnr,
+            "#FNAMN": self._h_fnamn,
+        }
 
     # --- Publika indata-varianter ---
 
@@ -172,16 +337,38 @@ class SIE4Parser:
 
     def parse_bytes(self, data: bytes,
                     encoding_candidates: Iterable[str] = DEFAULT_ENCODINGS) -> Company:
-        text, enc = self._decode_with_guess(data, encoding_candidates)
-        company = self.parse_text(text)
+        # Ren ASCII (vanligt för maskinexporter) avkodas direkt; stickprovet först gör
+        # att icke-ASCII-filer inte behöver en helskanning innan gissningen
+        if data[:_PROBE_BYTES].isascii() and data.isascii():
+            text, enc = data.decode("ascii"), "ascii"
+        else:
+            text, enc = self._decode_with_guess(data, encoding_candidates)
+        # Byteoffset == teckenoffset bara för enbytes-encodings (lika långa)
+        if scan_trans_lines is not None and len(data) >= _JIT_MIN_BYTES and len(text) == len(data):
+            company = self._parse_scanned(text, data)
+        else:
+            company = self.parse_text(text)
         company.source_encoding = enc
         return company
 
+    def parse_stream(self, f: IO[str]) -> Company:
+        """
+        Parsar från en öppen textström rad för rad, utan att läsa in hela texten.
+        Encoding bestäms av den som öppnade strömmen (source_encoding lämnas None).
+        """
+        return self._parse_lines(f)  # raderna strippas i _parse_lines
+
     def parse_file(self, path: Union[str, Path],
                    encoding_candidates: Iterable[str] = DEFAULT_ENCODINGS) -> Company:
+        """
+        Läser filen rad för rad (konstant minne) i stället för att läsa in hela texten.
+        Encoding bestäms en gång innan parsningen (se _sniff_file_encoding).
+        """
         p = Path(path)
-        data = p.read_bytes()
-        return self.parse_bytes(data, encoding_candidates)
+        enc, label, errors = self._sniff_file_encoding(p, encoding_candidates)
+        company = self._parse_lines(self._iter_lines(p, enc, errors))
+        company.source_encoding = label
+        return company
 
     def parse(self, source: Union[str, bytes, Path, IO[str], IO[bytes]]) -> Company:
         """
@@ -189,8 +376,10 @@ class SIE4Parser:
           - str: om fil finns -> fil, annars behandlas som SIE-text
           - bytes: tolkas via parse_bytes
           - Path: parse_file
-          - file-like: read() -> bytes eller str
+          - file-like: textström -> parse_stream, annars read() -> bytes eller str
         """
+        if isinstance(source, io.TextIOBase):
+            return self.parse_stream(source)
         if hasattr(source, "read"):  # file-like
             content = source.read()
             if isinstance(content, bytes):
@@ -213,156 +402,293 @@ class SIE4Parser:
 
     # --- Intern parsning ---
 
-    def _parse_lines(self, lines: List[str]) -> Company:
-        company = Company()
-        current_voucher: Optional[Voucher] = None
+    def _parse_scanned(self, text: str, data: bytes) -> Company:
+        """
+        Enkla #TRANS-rader tolkas redan av Numba-skannern (tools/_trans_scan.py);
+        övriga rader går genom _parse_lines som vanligt.
+        """
+        starts, ends, acc_s, acc_e, amounts, txt_s, txt_e = scan_trans_lines(
+            np.frombuffer(data, dtype=np.uint8))
+        state = _ParseState(company=Company())
+        intern_account = state.intern_account
+
+        def lines() -> Iterator[str]:
+            for s, e, a0, a1, amount, t0, t1 in zip(
+                    starts.tolist(), ends.tolist(), acc_s.tolist(), acc_e.tolist(),
+                    amounts.tolist(), txt_s.tolist(), txt_e.tolist()):
+                if a0 >= 0 and state.voucher is not None:
+                    state.voucher.add_transaction(
+                        intern_account(text[a0:a1]), amount, None, text[t0:t1] if t0 >= 0 else None)
+                else:
+                    yield text[s:e]
+
+        return self._parse_lines(lines(), state)
+
+    def _parse_lines(self, lines: Iterable[str], state: Optional[_ParseState] = None) -> Company:
+        if state is None:
+            state = _ParseState(company=Company())
+        # Lokala bindningar för den heta loopen (LOAD_FAST i stället för attributuppslag)
+        get_handler = self._handlers.get
+        split_command = self._split_command
+        parse_trans_fast = self._parse_trans_fast
+        add_voucher = state.company.vouchers.append
 
         for raw in lines:
-            line = raw.strip()
-            if not line or line.startswith(";;"):  # kommentar
+            if not raw:
                 continue
+            if raw[0].isspace():  # ovanligt: indragen rad
+                raw = raw.lstrip()
+                if not raw:
+                    continue
 
-            # block-delimiter
-            if line == "{":
-                # Vi väntar på #TRANS-rader efter #VER
-                continue
-            if line == "}":
-                if current_voucher:
-                    company.vouchers.append(current_voucher)
-                    current_voucher = None
+            # Första tecknet avgör radtypen; bara kommandorader och '}' behöver strippas
+            c0 = raw[0]
+            if c0 != "#":
+                # block-delimiter: '}' stänger verifikatet. '{' (vi väntar på #TRANS-rader
+                # efter #VER), ';;'-kommentarer och övriga rader ignoreras.
+                if c0 == "}" and raw.rstrip() == "}" and state.voucher:
+                    add_voucher(state.voucher)
+                    state.voucher = None
                 continue
+            line = raw.rstrip()
 
-            if not line.startswith("#"):
+            # Vanligaste raden: försök snabbvägen innan den generiska tokeniseringen
+            if line.startswith("#TRANS ") and parse_trans_fast(line, state):
                 continue
 
-            cmd, args = self._split_command(line)
-
-            if cmd == "#FLAGGA":
-                pass
-            elif cmd == "#PROGRAM":
-                company.program = " ".join(a for a in args if a).strip()
-            elif cmd == "#FORMAT":
-                company.format = args[0] if args else None
-            elif cmd == "#GEN":
-                company.generated = self._parse_date(args[0]) if args else None
-            elif cmd == "#SIETYP":
-                company.sietyp = args[0] if args else None
-            elif cmd == "#ORGNR":
-                company.orgnr = args[0] if args else None
-            elif cmd == "#FNAMN":
-                company.name = self._strip_quotes(args[0]) if args else None
-            elif cmd == "#RAR":
-                rar = RAR(idx=int(args[0]),
-                          start=self._parse_date(args[1]),
-                          end=self._parse_date(args[2]))
-                company.rars.append(rar)
-            elif cmd == "#KONTO":
-                acc_no = args[0]
-                acc_name = self._strip_quotes(args[1]) if len(args) > 1 else ""
-                acc = company.accounts.get(acc_no) or Account(number=acc_no)
-                acc.name = acc_name or acc.name
-                company.accounts[acc_no] = acc
-            elif cmd == "#SRU":
-                if len(args) >= 2:
-                    acc_no, sru = args[0], args[1]
-                    acc = company.accounts.get(acc_no) or Account(number=acc_no)
-                    acc.sru = sru
-                    company.accounts[acc_no] = acc
-            elif cmd == "#IB":
-                # #IB <konto> <belopp> [extra]
-                acc_no = args[0]
-                amount = self._first_number(args, start_idx=1)
-                if amount is None:
-                    continue
-                acc = company.accounts.get(acc_no) or Account(number=acc_no)
-                acc.opening_balance = amount
-                company.accounts[acc_no] = acc
-            elif cmd == "#UB":
-                # #UB <konto> <belopp> [extra]
-                acc_no = args[0]
-                amount = self._first_number(args, start_idx=1)
-                if amount is None:
-                    continue
-                acc = company.accounts.get(acc_no) or Account(number=acc_no)
-                acc.closing_balance = amount
-                company.accounts[acc_no] = acc
-            elif cmd == "#VER":
-                # #VER A 1 20240110 "Text" 20240110
-                series = args[0]
-                number = args[1]
-                vdate = self._parse_date(args[2])
-                text = self._strip_quotes(args[3]) if len(args) > 3 else ""
-                reg_date = self._parse_date(args[4]) if len(args) > 4 else None
-                current_voucher = Voucher(series=series, number=number, date=vdate, text=text, reg_date=reg_date)
-            elif cmd == "#TRANS":
-                # #TRANS <konto> <belopp> ["text"] [dim...]
-                if current_voucher is None:
-                    # Malformad fil; hoppa över
-                    continue
-                acc_no = args[0]
-                amount = self._first_number(args, start_idx=1)
-                if amount is None:
-                    # hoppa över trasig rad i stället för att krascha
-                    continue
-
-                # Hämta citerad text om den finns
-                tx_text = None
-                for t in args[1:]:
-                    if self._is_quoted(t):
-                        tx_text = self._strip_quotes(t)
-                        break
-
-                # Grovt bevara övriga icke-tals/icke-citerade tokens som "dimensioner"
-                dims = tuple(a for a in args[1:]
-                             if not self._num_re.match(a)
-                             and not self._is_quoted(a)
-                             and a not in ("{", "}", "{}"))
-
-                current_voucher.transactions.append(
-                    Transaction(account=acc_no, amount=float(str(amount).replace(",", ".")),
-                                dim=dims or None, text=tx_text)
-                )
-            else:
-                # Ignorera övriga taggar tills vidare (#RES, #OBJEKT, #KUND, ...)
-                pass
+            cmd, args = split_command(line)
+            handler = get_handler(cmd)
+            if handler is not None:
+                handler(args, state)
+            # Övriga taggar ignoreras tills vidare (#FLAGGA, #RES, #OBJEKT, #KUND, ...)
 
+        company = state.company
         if self.infer_account_hierarchy and company.accounts:
             self._build_account_hierarchy(company.accounts)
         return company
 
+    # --- Kommandohanterare (en per #-tagg, se _handlers) ---
+
+    def _h_program(self, args: List[str], state: _ParseState) -> None:
+        state.company.program = " ".join(a for a in args if a).strip()
+
+    def _h_format(self, args: List[str], state: _ParseState) -> None:
+        state.company.format = args[0] if args else None
+
+    def _h_gen(self, args: List[str], state: _ParseState) -> None:
+        state.company.generated = state.parse_date(args[0]) if args else None
+
+    def _h_sietyp(self, args: List[str], state: _ParseState) -> None:
+        state.company.sietyp = args[0] if args else None
+
+    def _h_orgnr(self, args: List[str], state: _ParseState) -> None:
+        state.company.orgnr = args[0] if args else None
+
+    def _h_fnamn(self, args: List[str], state: _ParseState) -> None:
+        if args:
+            name = args[0]
+            state.company.name = name[1:-1] if name[0] in _QUOTES else name
+        else:
+            state.company.name = None
+
+    def _h_rar(self, args: List[str], state: _ParseState) -> None:
+        rar = RAR(idx=int(args[0]),
+                  start=state.parse_date(args[1]),
+                  end=state.parse_date(args[2]))
+        state.company.rars.append(rar)
+
+    def _h_konto(self, args: List[str], state: _ParseState) -> None:
+        accounts = state.company.accounts
+        acc_no = args[0]
+        acc_name = ""
+        if len(args) > 1:
+            acc_name = args[1]
+            if acc_name[0] in _QUOTES:  # citerad token har alltid matchande slutcitat
+                acc_name = acc_name[1:-1]
+        acc = accounts.get(acc_no)
+        if acc is None:
+            acc = accounts[acc_no] = Account(number=acc_no)
+        acc.name = acc_name or acc.name
+
+    def _h_sru(self, args: List[str], state: _ParseState) -> None:
+        if len(args) >= 2:
+            accounts = state.company.accounts
+            acc_no, sru = args[0], args[1]
+            acc = accounts.get(acc_no)
+            if acc is None:
+                acc = accounts[acc_no] = Account(number=acc_no)
+            acc.sru = sru
+
+    def _h_ib(self, args: List[str], state: _ParseState) -> None:
+        # #IB <konto> <belopp> [extra]
+        accounts = state.company.accounts
+        acc_no = args[0]
+        amount = self._first_number(args, start_idx=1)
+        if amount is None:
+            return
+        acc = accounts.get(acc_no)
+        if acc is None:
+            acc = accounts[acc_no] = Account(number=acc_no)
+        acc.opening_balance = amount
+
+    def _h_ub(self, args: List[str], state: _ParseState) -> None:
+        # #UB <konto> <belopp> [extra]
+        accounts = state.company.accounts
+        acc_no = args[0]
+        amount = self._first_number(args, start_idx=1)
+        if amount is None:
+            return
+        acc = accounts.get(acc_no)
+        if acc is None:
+            acc = accounts[acc_no] = Account(number=acc_no)
+        acc.closing_balance = amount
+
+    def _h_ver(self, args: List[str], state: _ParseState) -> None:
+        # #VER A 1 20240110 "Text" 20240110
+        series = state.strings.setdefault(args[0], args[0])  # få serier, många verifikat
+        number = args[1]
+        vdate = state.parse_date(args[2])
+        text = ""
+        if len(args) > 3:
+            text = args[3]
+            if text[0] in _QUOTES:  # citerad token har alltid matchande slutcitat
+                text = text[1:-1]
+        reg_date = state.parse_date(args[4]) if len(args) > 4 else None
+        state.voucher = Voucher(series=series, number=number, date=vdate, text=text, reg_date=reg_date)
+
+    def _parse_trans_fast(self, line: str, state: _ParseState) -> bool:
+        """
+        Snabbväg för '#TRANS <konto> [{...}] <belopp> [tal/dim...] ["text"]'.
+        Klassar varje token en gång (belopp, dimension eller klammer) utan
+        _split_command; returnerar False om raden avviker (fler citat, apostrof,
+        tab) så att den generiska vägen (_split_command + _h_trans) tar över.
+        """
+        voucher = state.voucher
+        if voucher is None or "\t" in line:
+            return False
+        q = line.find('"')
+        if q >= 0:
+            # Endast en citerad text, sist på raden och föregången av mellanslag
+            last = len(line) - 1
+            if q == last or line[q - 1] != " " or line.find('"', q + 1) != last:
+                return False
+            head, tx_text = line[7:q], line[q + 1:last]
+        else:
+            head, tx_text = line[7:], None
+        if "'" in head:
+            return False
+
+        tokens = head.split()
+        if not tokens:
+            return False
+        # Samma klassning som _h_trans: första talet är belopp, övriga
+        # icke-tal utom klamrar blir dimensioner
+        amount = None
+        found = None
+        for t in tokens[1:]:
+            n = _to_number(t)
+            if n is None:
+                if t not in ("{", "}", "{}"):
+                    if found is None:
+                        found = []
+                    found.append(t)
+            elif amount is None:
+                amount = n
+        if amount is None:
+            return False
+
+        dims = state.intern_dims(found) if found else None
+        voucher.add_transaction(state.intern_account(tokens[0]), amount, dims, tx_text)
+        return True
+
+    def _h_trans(self, args: List[str], state: _ParseState) -> None:
+        # #TRANS <konto> <belopp> ["text"] [dim...]
+        if state.voucher is None:
+            # Malformad fil; hoppa över
+            return
+        # Ett pass över tokens: första talet blir belopp, första citerade token
+        # blir text, övriga icke-tals/icke-citerade tokens bevaras grovt som
+        # "dimensioner". Tokeniseringen behåller citattecknen, så första tecknet
+        # avgör om en token var citerad.
+        amount = None
+        tx_text = None
+        found = []
+        for a in args[1:]:
+            if a[0] in _QUOTES:
+                if tx_text is None:
+                    tx_text = a[1:-1]
+                continue
+            n = _to_number(a)
+            if n is None:
+                if a not in ("{", "}", "{}"):
+                    found.append(a)
+            elif amount is None:
+                amount = n
+        if amount is None:
+            # hoppa över trasig rad i stället för att krascha
+            return
+        acc_no = state.intern_account(args[0])
+        dims = state.intern_dims(found) if found else None
+
+        state.voucher.add_transaction(acc_no, amount, dims, tx_text)
+
     # ---------------------------
     # Hjälpare
     # ---------------------------
 
+    @staticmethod
+    def _iter_lines(path: Path, encoding: str, errors: str = "strict") -> Iterator[str]:
+        # newline="" ger universella radslut (\n, \r\n, \r) utan översättning
+        with path.open(encoding=encoding, errors=errors, newline="") as f:
+            for line in f:
+                yield line.rstrip("\r\n")
+
     @staticmethod
     def _normalize_lines(text: str) -> List[str]:
-        return text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        # Bara \r\n, \r och \n är radslut (som i parse_file/parse_stream); splitlines()
+        # skulle även dela på \x0c, \x85, U+2028 m.fl. inuti citerad text.
+        # replace() returnerar samma objekt när inget finns att ersätta.
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text.split("\n")
 
     @staticmethod
     def _parse_date(s: str) -> date:
-        s = re.sub(r'[^0-9]', '', s)
-        return datetime.strptime(s, "%Y%m%d").date()
+        return _parse_yyyymmdd(s)
 
     @staticmethod
     def _strip_quotes(s: str) -> str:
+        # Generell variant för godtyckliga strängar; hanterarna avcitar _split_command-tokens inline
         if len(s) >= 2 and ((s[0] == s[-1] == '"') or (s[0] == s[-1] == "'")):
             return s[1:-1]
         return s
 
-    @staticmethod
-    def _is_quoted(s: str) -> bool:
-        return len(s) >= 2 and s[0] in ('"', "'") and s[-1] == s[0]
-
     @staticmethod
     def _split_command(line: str) -> Tuple[str, List[str]]:
         """
         Dela upp '#CMD args...' i (cmd, args) med citat-medveten tokenisering.
+        Hoppar mellan tokens med str.find i stället för att läsa tecken för tecken.
+        Citerade tokens behåller sina citattecken (även oavslutade), så en token
+        är citerad om och endast om den börjar med ' eller ".
         """
-        m = re.match(r"^(#[A-Z0-9]+)\s*(.*)$", line, re.IGNORECASE)
-        if not m:
-            return line, []
-        cmd, rest = m.group(1), m.group(2)
-
+        cmd, sep, rest = line.partition(" ")
+        if not (cmd.isascii() and cmd[1:].isalnum()):
+            # ovanligt: tab/annat blanktecken eller annat tecken direkt efter kommandot;
+            # kommandot slutar då vid första tecken utanför [A-Z0-9]
+            m = _CMD_RE.match(line)
+            if m is None:
+                return line, []
+            cmd, rest = m.group(), line[m.end():]
+            sep = rest
+        cmd = cmd.upper()
+        if not sep:
+            return cmd, []  # t.ex. #FLAGGA utan argument
+        if '"' not in rest and "'" not in rest:
+            return cmd, rest.split()  # inga citat: en enda split i C räcker
+
+        # Samma avskiljare som str.split() (isspace). I utskrivbar text är mellanslag
+        # det enda blanktecknet, så tokenslutet kan hittas med str.find.
+        printable = rest.isprintable()
         args: List[str] = []
         i, n = 0, len(rest)
         while i < n:
@@ -370,33 +696,49 @@ class SIE4Parser:
                 i += 1
             if i >= n:
                 break
-            if rest[i] in ("'", '"'):
-                q = rest[i]
-                i += 1
-                buf = []
-                while i < n:
-                    ch = rest[i]
-                    if ch == q:
-                        break
-                    buf.append(ch)
-                    i += 1
-                args.append(q + "".join(buf) + q)
-                i += 1  # hoppa över avslutande citat
+            q = rest[i]
+            if q in _QUOTES:
+                end = rest.find(q, i + 1)
+                if end < 0:
+                    # oavslutat citat: resten av raden, men returnera som citerad token
+                    args.append(rest[i:] + q)
+                    break
+                args.append(rest[i:end + 1])
+                i = end + 1  # hoppa över avslutande citat
+            elif printable:
+                end = rest.find(" ", i)
+                if end < 0:
+                    end = n
+                args.append(rest[i:end])
+                i = end + 1  # avskiljaren är redan känd
             else:
+                # ovanligt: tab, \xa0, \x0c m.fl. i raden
                 start = i
                 while i < n and not rest[i].isspace():
                     i += 1
                 args.append(rest[start:i])
-        return cmd.upper(), args
+        return cmd, args
 
     def _decode_with_guess(self, data: bytes, encodings: Iterable[str]) -> Tuple[str, str]:
         """
         Testa flera encodings och returnera (text, lyckad_encoding).
         Ordningen styrs av DEFAULT_ENCODINGS; inkluderar cp865 för OEM 865.
+        Varje kandidat provas först på ett stickprov så att en felaktig gissning
+        inte kostar en avkodning av hela filen.
         """
+        if data.startswith(codecs.BOM_UTF8):
+            try:
+                return data.decode("utf-8-sig"), "utf-8-sig"
+            except UnicodeDecodeError:
+                pass
+        head = data[:_PROBE_BYTES]
+        probe = not head.isascii()  # rent ASCII-stickprov avgör ingenting
         last_exc = None
         for enc in encodings:
             try:
+                if probe:
+                    # inkrementell avkodare: ett tecken kluvet vid stickprovsgränsen är inget fel
+                    codecs.getincrementaldecoder(enc)().decode(head, final=False)
                 text = data.decode(enc)
                 return text, enc
             except Exception as e:
@@ -406,45 +748,74 @@ class SIE4Parser:
         text = data.decode("latin1", errors="replace")
         return text, "latin1-replace"
 
+    def _sniff_file_encoding(self, path: Path, encodings: Iterable[str]) -> Tuple[str, str, str]:
+        """
+        Filvarianten av _decode_with_guess: returnera (encoding, etikett, errors).
+        Kandidaterna provas på ett stickprov och sedan med en inkrementell avkodare
+        i block, utan att bygga någon text – filen parsas därefter bara en gång.
+        """
+        with path.open("rb") as f:
+            head = f.read(_PROBE_BYTES)
+        if head.startswith(codecs.BOM_UTF8) and self._file_decodes(path, "utf-8-sig"):
+            return "utf-8-sig", "utf-8-sig", "strict"
+        # Ren ASCII rapporteras som 'ascii', precis som i parse_bytes
+        if head.isascii() and self._file_decodes(path, "ascii"):
+            return "ascii", "ascii", "strict"
+        probe = not head.isascii()  # rent ASCII-stickprov avgör ingenting
+        for enc in encodings:
+            try:
+                if probe:
+                    codecs.getincrementaldecoder(enc)().decode(head, final=False)
+            except (UnicodeDecodeError, LookupError):
+                continue
+            if self._file_decodes(path, enc):
+                return enc, enc, "strict"
+        # Fallback: latin1 med ersättningstecken, markerad som 'latin1-replace'
+        return "latin1", "latin1-replace", "replace"
+
+    @staticmethod
+    def _file_decodes(path: Path, encoding: str) -> bool:
+        # Avkodar i block och kastar resultatet; konstant minne oavsett filstorlek
+        try:
+            decoder = codecs.getincrementaldecoder(encoding)()
+            with path.open("rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+        except (UnicodeDecodeError, LookupError):
+            return False
+        return True
+
     def _first_number(self, tokens: List[str], start_idx: int = 0) -> Optional[float]:
         """
         Hitta första token som ser ut som ett tal (t.ex. -1000,00 eller 1000.00).
         Ignorerar klammerbrus och icke-numeriska tokens.
         """
         for t in tokens[start_idx:]:
-            tt = t.strip()
-            if tt in ('{', '}', '{}'):
-                continue
-            if self._num_re.match(tt):
-                try:
-                    return float(tt.replace(',', '.'))
-                except ValueError:
-                    continue
+            n = _to_number(t.strip())
+            if n is not None:
+                return n
         return None
 
     @staticmethod
     def _build_account_hierarchy(accounts: Dict[str, Account]) -> None:
-        # Skapa parent/child med numeriska prefix (BAS)
-        for num, acc in list(accounts.items()):
-            if not num.isdigit() or len(num) == 1:
-                continue
-            if len(num) >= 4:
-                prefs = [num[:3], num[:2], num[:1]]
-            elif len(num) == 3:
-                prefs = [num[:2], num[:1]]
-            else:  # len == 2
-                prefs = [num[:1]]
-            for p in prefs:
-                parent = accounts.get(p)
-                if parent and parent is not acc and acc.parent is None:
-                    acc.parent = parent
-                    if acc not in parent.children:
-                        parent.children.append(acc)
-                    break
-        # Top-nivå (1-siffriga) saknar parent
+        # Skapa parent/child med numeriska prefix (BAS): närmaste befintliga prefix
+        # (högst 3 siffror) blir parent. Top-nivå (1-siffriga) saknar parent.
+        get = accounts.get
         for num, acc in accounts.items():
-            if num.isdigit() and len(num) == 1:
-                acc.parent = None
+            n = len(num)
+            if n < 2 or acc.parent is not None or not num.isdigit():
+                continue  # redan kopplade konton hoppas över (inga dubbla children)
+            # Utrullade prefixuppslag, längsta först (Account-objekt är alltid sanna)
+            if n >= 4:
+                parent = get(num[:3]) or get(num[:2]) or get(num[:1])
+            elif n == 3:
+                parent = get(num[:2]) or get(num[:1])
+            else:
+                parent = get(num[:1])
+            if parent is not None:
+                acc.parent = parent
+                parent.children.append(acc)  # parent sätts en gång per konto: ingen dubblettkontroll
 
 
 # ---------------------------